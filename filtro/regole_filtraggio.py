@@ -132,11 +132,17 @@ def filter_raw_points(raw_points: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
 def filter_structured_points(structured_points: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """Filtra punti strutturati secondo regole d'oro.
 
-    Supporta sia dict che Point objects nativi InfluxDB.
+    Supporta dict, Point objects nativi InfluxDB e righe line protocol.
     """
     result = []
 
     for point in structured_points:
+        # Riga line protocol (parser realtime): passa direttamente se non vuota
+        if isinstance(point, str):
+            if point:
+                result.append(point)
+            continue
+
         # Se è un Point object InfluxDB, passa direttamente (già validato)
         if hasattr(point, 'to_line_protocol'):
             result.append(point)
@@ -3,7 +3,7 @@ from typing import Optional, Dict, Any
 from logging import Logger
 from cache.cache_manager import CacheManager
 from collector.collector_gme import CollectorGME
-from parser.gme_parser import create_parser
+from parser.gme_parser import create_parser, GME_LINE_PRECISION
 from storage.writer_influx import InfluxWriter
 from utils.color_logger import color
 from datetime import datetime, timedelta
@@ -35,6 +35,8 @@ def run_gme_flow(
     scheduler_config = SchedulerConfig.from_config(config)
     scheduler = SchedulerLoop(scheduler_config)
     collector = CollectorGME(scheduler=scheduler)
+    # Un solo parser per tutto l'intervallo: riusa le cache dei timestamp mensili
+    parser = create_parser()
 
     try:
         current_date = datetime.strptime(start_date, '%Y-%m-%d')
@@ -64,8 +66,7 @@ def run_gme_flow(
                 cache.save_to_cache("gme", "data", date_str, raw_data)
 
             # 3. Parse Hourly
-            parser = create_parser()
-            influx_points = parser.parse(raw_data)
+            influx_points = parser.parse_line_protocol(raw_data)
 
             if not influx_points:
                 log.warning(f"⚠️ Nessun punto generato per {date_str}")
@@ -95,7 +96,8 @@ def run_gme_flow(
 
             # 5. Write to InfluxDB
             with InfluxWriter() as writer:
-                writer.write_points(influx_points, measurement_type="gme_prices")
+                writer.write_points(influx_points, measurement_type="gme_prices",
+                                    line_precision=GME_LINE_PRECISION)
                 if monthly_avg_point:
                     writer.write_points([monthly_avg_point], measurement_type="gme_monthly_avg")
                 total_points += len(influx_points) + (1 if monthly_avg_point else 0)
@@ -214,14 +216,14 @@ def run_gme_month_flow(
     parser = create_parser()
 
     # 1. Parse hourly points
-    # Ricostruiamo un oggetto gme_data fittizio per usare parser.parse()
+    # Ricostruiamo un oggetto gme_data fittizio per usare il parser
     month_data_combined = {
         'date': f"{year}-{month:02d}-01",
         'prices': all_prices,
         'source': 'GME',
         'market': 'MGP'
     }
-    hourly_points = parser.parse(month_data_combined)
+    hourly_points = parser.parse_line_protocol(month_data_combined)
 
     if not hourly_points:
         log.warning(f"⚠️ Nessun punto generato per {year}-{month:02d}")
@@ -235,7 +237,8 @@ def run_gme_month_flow(
 
     with InfluxWriter() as writer:
         # Scrivi punti orari
-        writer.write_points(hourly_points, measurement_type="gme_prices")
+        writer.write_points(hourly_points, measurement_type="gme_prices",
+                            line_precision=GME_LINE_PRECISION)
         # Scrivi media mensile
         if monthly_avg_point:
             writer.write_points([monthly_avg_point], measurement_type="gme_monthly_avg")
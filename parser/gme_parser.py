@@ -1,10 +1,16 @@
 """GME Parser - Conversione prezzi GME in InfluxDB Points"""
 
-from datetime import datetime, timedelta
-from typing import Dict, List, Any, Tuple, Optional
+from datetime import datetime, timedelta, timezone as dt_timezone, tzinfo
+from typing import Callable, Dict, Iterable, Iterator, List, Any, NamedTuple, Sequence, Tuple, Optional
+import calendar
 import logging
+import math
+import sys
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import pytz
 
+from parser.line_protocol import escape_tag, format_float
+
 try:
     from influxdb_client import Point, WritePrecision
     INFLUX_AVAILABLE = True
@@ -14,6 +20,57 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+_EPOCH = datetime(1970, 1, 1)
+_ONE_SECOND = timedelta(seconds=1)
+# Ore GME possibili in un giorno: 1..24, più la 25 nel giorno di ritorno all'ora solare
+_MAX_GME_HOURS = 25
+# Precisione dei timestamp GME: i prezzi sono orari, i secondi bastano e accorciano le righe.
+# Le righe di parse_line_protocol() vanno scritte con questa precisione (non con quella di default ns)
+GME_LINE_PRECISION = 's'
+# Valori dei tag ripetuti su ogni punto: stringhe internate e condivise tra tutti i Points
+_SOURCE_GME = sys.intern("GME")
+_MARKET_MGP = sys.intern("MGP")
+# Nomi dei mesi in inglese per il tag "month", indipendenti dal locale di sistema
+_MONTHS_EN = tuple(sys.intern(name) for name in (
+    '', 'January', 'February', 'March', 'April', 'May', 'June',
+    'July', 'August', 'September', 'October', 'November', 'December'))
+# Per ogni ora GME (indice hour - 1): tag "hour" e secondi dall'inizio del giorno locale.
+# L'ora 25 cade a +86400, cioè la mezzanotte del giorno successivo
+_HOUR_LOOKUP = tuple((sys.intern(str(hour)), (hour - 1) * 3600)
+                     for hour in range(1, _MAX_GME_HOURS + 1))
+
+
+def _parse_ymd(date_str: str) -> Tuple[int, int, int]:
+    """Estrae (anno, mese, giorno) da una data YYYY-MM-DD senza passare da strptime"""
+    if not isinstance(date_str, str) or len(date_str) != 10 or date_str[4] != '-' or date_str[7] != '-':
+        raise ValueError(f"Data non valida (atteso YYYY-MM-DD): {date_str}")
+    return int(date_str[0:4]), int(date_str[5:7]), int(date_str[8:10])
+
+
+def _load_timezone(name: str) -> tzinfo:
+    """Timezone stdlib (zoneinfo), con pytz come fallback se il database tz di sistema non la contiene"""
+    try:
+        return ZoneInfo(name)
+    except ZoneInfoNotFoundError:
+        logger.warning(f"Timezone {name} non trovata in zoneinfo, uso pytz")
+    return pytz.timezone(name)
+
+
+def _day_tags(year: int, month: int, day: int) -> Tuple[str, str, str]:
+    """Valori dei tag year/month/day di un giorno"""
+    return str(year), _MONTHS_EN[month], str(day)
+
+
+class _DayContext(NamedTuple):
+    """Dati derivati di un giorno GME, condivisi da tutte le sue ore"""
+    year_str: str
+    month_name: str
+    day_str: str
+    # Timestamp UTC in secondi indicizzati per hour - 1 (da _compute_timestamps)
+    timestamps: Tuple[int, ...]
+    # Tag (year, month, day) del giorno successivo, usati dall'ora 25
+    next_day_tags: Tuple[str, str, str]
+
 
 class GMEParser:
     """Parser per convertire dati GME in InfluxDB Points"""
@@ -25,7 +82,9 @@ class GMEParser:
         Args:
             timezone: Timezone per i timestamp (default: Europe/Rome)
         """
-        self.timezone = pytz.timezone(timezone)
+        self.timezone = _load_timezone(timezone)
+        # Timestamp UTC (s) della mezzanotte del primo giorno del mese, per (anno, mese)
+        self._month_ts_cache: Dict[Tuple[int, int], int] = {}
 
     def parse(self, gme_data: Dict[str, Any]) -> List[Point]:
         """
@@ -41,141 +100,341 @@ class GMEParser:
         Returns:
             Lista di InfluxDB Point objects pronti per scrittura
         """
-        if not INFLUX_AVAILABLE:
-            logger.error("InfluxDB client non disponibile, impossibile creare Points")
+        if not self._has_prices(gme_data):
             return []
 
+        points = list(self._iter_records(gme_data, self._create_gme_point))
+        logger.info(f"✅ Generati {len(points)} InfluxDB Points GME per {gme_data.get('date')}")
+        return points
+
+    def parse_line_protocol(self, gme_data: Dict[str, Any]) -> List[str]:
+        """
+        Converte dati GME direttamente in righe InfluxDB line protocol
+
+        Stesso contenuto di parse() senza costruire Point objects: le righe
+        (timestamp in secondi) vanno scritte dal writer con line_precision=GME_LINE_PRECISION.
+
+        Args:
+            gme_data: Dizionario GME (vedi parse())
+
+        Returns:
+            Lista di righe line protocol pronte per scrittura
+        """
+        if not self._has_prices(gme_data):
+            return []
+
+        lines = list(self._iter_records(gme_data, self._create_gme_line))
+        logger.info(f"✅ Generate {len(lines)} righe line protocol GME per {gme_data.get('date')}")
+        return lines
+
+    @staticmethod
+    def _has_prices(gme_data: Optional[Dict[str, Any]]) -> bool:
+        """Verifica che i dati GME contengano i prezzi (None o dict senza 'prices' vengono scartati con un log)"""
         if not gme_data or 'prices' not in gme_data:
             logger.warning("Dati GME vuoti o malformati")
-            return []
+            return False
+        return True
+
+    def _iter_records(self, gme_data: Dict[str, Any], build_record: Callable[..., Any]) -> Iterator[Any]:
+        """
+        Valida i dati GME e costruisce un record per ogni prezzo orario
+
+        Args:
+            gme_data: Dizionario GME (vedi parse())
+            build_record: _create_gme_point o _create_gme_line
 
+        Yields:
+            Record costruiti (nessuno se dati non validi)
+        """
+        # Presenza dei prezzi già verificata dal chiamante (_has_prices)
         date_str = gme_data.get('date')
         prices = gme_data.get('prices', [])
-        source = gme_data.get('source', 'GME')
-        market = gme_data.get('market', 'MGP')
+        source = gme_data.get('source', _SOURCE_GME)
+        market = gme_data.get('market', _MARKET_MGP)
 
         if not date_str:
             logger.error("Data mancante nei dati GME")
-            return []
+            return
+
+        # Un solo passaggio sui dict dei prezzi, poi solo spacchettamento posizionale.
+        # La data specifica del prezzo (history mode) ha precedenza su quella del contenitore
+        # pun_kwh non viene letto: si salva solo pun_mwh
+        rows = ((p.get('hour'), p.get('pun_mwh'), p.get('date', date_str)) for p in prices)
+
+        # Contesto per giorno, calcolato una volta per data distinta in questa chiamata
+        # (None memorizzato per le date non valide: il log compare una volta sola)
+        day_contexts: Dict[str, Optional[_DayContext]] = {}
+
+        # Righe già validate in blocco: nessun try/except nel ciclo di costruzione
+        for hour, pun_mwh, item_date_str in self._validate_rows(rows):
+            # Timestamp e tag precalcolati per giorno (None se la data non è valida)
+            if item_date_str in day_contexts:
+                ctx = day_contexts[item_date_str]
+            else:
+                ctx = day_contexts[item_date_str] = self._build_day_context(item_date_str)
+            if ctx is None:
+                continue
 
-        points = []
+            yield build_record(hour, pun_mwh, source, market, ctx)
+
+    @staticmethod
+    def _validate_rows(rows: Iterable[Tuple[Any, Any, Any]]) -> Iterator[Tuple[int, float, str]]:
+        """
+        Valida in blocco i prezzi orari, scartando con un log le righe non utilizzabili
 
-        for price_data in prices:
-            try:
-                point = self._create_gme_point(price_data, date_str, source, market)
-                if point:
-                    points.append(point)
-            except Exception as e:
-                logger.error(f"Errore creazione point GME per ora {price_data.get('hour')}: {e}")
+        Args:
+            rows: Tuple (hour, pun_mwh, date) estratte dai prezzi
+
+        Yields:
+            Tuple (hour, pun_mwh, date) valide, con pun_mwh già convertito a float
+        """
+        for hour, pun_mwh, item_date_str in rows:
+            if hour is None or pun_mwh is None:
+                logger.warning(f"Dati incompleti per punto GME {item_date_str}: hour={hour}, pun_mwh={pun_mwh}")
                 continue
 
-        logger.info(f"✅ Generati {len(points)} InfluxDB Points GME per {date_str}")
-        return points
+            if not isinstance(hour, int) or not 1 <= hour <= _MAX_GME_HOURS:
+                logger.error(f"Ora GME fuori range per {item_date_str}: {hour}")
+                continue
+
+            # Il collector fornisce già float: conversione solo per valori di altro tipo
+            if type(pun_mwh) is float:
+                value = pun_mwh
+            else:
+                try:
+                    value = float(pun_mwh)
+                except (TypeError, ValueError):
+                    logger.error(f"Prezzo GME non numerico per {item_date_str} ora {hour}: {pun_mwh}")
+                    continue
+
+            if not math.isfinite(value):
+                logger.error(f"Prezzo GME non finito per {item_date_str} ora {hour}: {pun_mwh}")
+                continue
 
-    def _create_gme_point(self, price_data: Dict[str, Any], date_str: str,
-                         source: str, market: str) -> Point:
+            yield hour, value, item_date_str
+
+    def _build_day_context(self, date_str: str) -> Optional[_DayContext]:
         """
-        Crea un singolo InfluxDB Point per un prezzo orario
+        Timestamp orari e tag di un giorno (calcolato una volta per data da _iter_records)
 
         Args:
-            price_data: Dizionario con hour, pun_mwh, pun_kwh, e opzionalmente date
-            date_str: Data di fallback in formato YYYY-MM-DD
-            source: Fonte dati (es. "GME")
-            market: Mercato (es. "MGP")
+            date_str: Data in formato YYYY-MM-DD
 
         Returns:
-            InfluxDB Point object
+            _DayContext del giorno o None se data non valida
+        """
+        try:
+            year, month, day = _parse_ymd(date_str)
+            # Valida anche mese/giorno (es. 2024-02-30)
+            next_day = datetime(year, month, day) + timedelta(days=1)
+        except ValueError as e:
+            # Solo errori di parsing/validazione della data: gli altri errori non vanno mascherati
+            logger.error(f"Data GME non valida {date_str}: {e}")
+            return None
+
+        timestamps = self._compute_timestamps(year, month, day)
+        return _DayContext(*_day_tags(year, month, day), timestamps,
+                           _day_tags(next_day.year, next_day.month, next_day.day))
+
+    def _compute_timestamps(self, year: int, month: int, day: int) -> Tuple[int, ...]:
         """
-        hour = price_data.get('hour')
-        pun_mwh = price_data.get('pun_mwh')
-        pun_kwh = price_data.get('pun_kwh')
+        Calcola in un solo passaggio i timestamp UTC di tutte le ore GME di un giorno
 
-        # Usa la data specifica del prezzo se presente (per history mode), altrimenti quella del contenitore
-        item_date_str = price_data.get('date', date_str)
+        L'ora h corrisponde all'inizio dell'ora locale h-1; l'ora 25 coincide con la
+        mezzanotte del giorno successivo. In un giorno ci sono al massimo due offset
+        UTC (prima e dopo il cambio ora): vengono risolti una volta sola e applicati
+        con aritmetica intera.
 
-        if hour is None or pun_kwh is None:
-            logger.warning(f"Dati incompleti per punto GME: {price_data}")
-            return None
+        Args:
+            year: Anno del giorno GME
+            month: Mese del giorno GME
+            day: Giorno del mese (data già validata)
+
+        Returns:
+            Tupla di timestamp in secondi (epoch) indicizzata per hour - 1
+        """
+        midnight = datetime(year, month, day)
+        offset_before = self._standard_offset(midnight)
+        offset_after = self._standard_offset(midnight + timedelta(days=1))
+
+        # Prima ora locale che usa l'offset successivo al cambio ora
+        # (stessa semantica di localize() con is_dst=False per ore ambigue/inesistenti)
+        switch_index = _MAX_GME_HOURS
+        if offset_before != offset_after:
+            for hour_index in range(1, _MAX_GME_HOURS):
+                if self._standard_offset(midnight + timedelta(hours=hour_index)) == offset_after:
+                    switch_index = hour_index
+                    break
+
+        midnight_epoch = (midnight - _EPOCH) // _ONE_SECOND
+        timestamps = []
+        for hour_index, (_, sec_offset) in enumerate(_HOUR_LOOKUP):
+            offset = offset_before if hour_index < switch_index else offset_after
+            timestamps.append(midnight_epoch + sec_offset - offset)
+
+        return tuple(timestamps)
+
+    def _standard_offset(self, local_dt: datetime) -> int:
+        """
+        Offset UTC in secondi di un orario locale naive
+
+        Per ore ambigue (ritorno all'ora solare) o inesistenti (passaggio all'ora
+        legale) sceglie l'ora solare, come localize() di pytz con is_dst=False.
+
+        Args:
+            local_dt: Datetime naive nella timezone del parser
+
+        Returns:
+            Offset UTC in secondi
+        """
+        if isinstance(self.timezone, pytz.BaseTzInfo):
+            # localize() è supportato da tutte le timezone pytz (anche UTC e StaticTzInfo)
+            return self.timezone.localize(local_dt, is_dst=False).utcoffset() // _ONE_SECOND
+
+        earlier = local_dt.replace(tzinfo=self.timezone, fold=0)
+        later = local_dt.replace(tzinfo=self.timezone, fold=1)
+        if earlier.utcoffset() != later.utcoffset():
+            # Ora ambigua o inesistente: vale l'offset senza DST
+            for candidate in (earlier, later):
+                if not candidate.dst():
+                    return candidate.utcoffset() // _ONE_SECOND
+        return earlier.utcoffset() // _ONE_SECOND
+
+    def _localize(self, local_dt: datetime) -> datetime:
+        """Rende aware un datetime naive nella timezone del parser (zoneinfo o pytz)"""
+        if isinstance(self.timezone, pytz.BaseTzInfo):
+            return self.timezone.localize(local_dt)
+        return local_dt.replace(tzinfo=self.timezone)
+
+    def _resolve_gme_row(self, hour: int, ctx: _DayContext) -> Tuple[str, str, str, int]:
+        """
+        Ricava tag e timestamp di un prezzo orario già validato
+
+        Args:
+            hour: Ora GME (1..25)
+            ctx: Contesto del giorno del prezzo
 
-        # Crea timestamp per l'ora specifica
-        # Ora 1 = 00:00-01:00, Ora 2 = 01:00-02:00, etc.
-        # Usiamo l'inizio dell'ora (hour - 1)
+        Returns:
+            Tupla (year, month, day, ts_sec)
+        """
+        # Ora 1 = 00:00-01:00, Ora 2 = 01:00-02:00, etc. (timestamp = inizio dell'ora)
         # Gestione speciale per ora 25 (cambio ora solare): diventa 00:00 del giorno dopo
         if hour == 25:
-            # Ora 25 = mezzanotte del giorno successivo
-            date_obj = datetime.strptime(item_date_str, '%Y-%m-%d')
-            next_day = date_obj + timedelta(days=1)
-            timestamp_str = next_day.strftime('%Y-%m-%d') + " 00:00:00"
+            year_str, month_name, day_str = ctx.next_day_tags
         else:
-            timestamp_str = f"{item_date_str} {hour-1:02d}:00:00"
+            year_str, month_name, day_str = ctx.year_str, ctx.month_name, ctx.day_str
 
-        try:
-            # Parse timestamp con timezone
-            ts_local = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-            ts_aware = self.timezone.localize(ts_local)
-            ts_utc = ts_aware.astimezone(pytz.utc)
-            ts_ns = int(ts_utc.timestamp() * 1_000_000_000)
-        except Exception as e:
-            logger.error(f"Errore parsing timestamp {timestamp_str}: {e}")
-            return None
+        # Timestamp UTC già calcolato per l'intero giorno
+        return year_str, month_name, day_str, ctx.timestamps[hour - 1]
 
-        # Crea Point InfluxDB
-        point = Point("gme_prices")
+    def _create_gme_point(self, hour: int, pun_mwh: float, source: str, market: str,
+                         ctx: _DayContext) -> Point:
+        """
+        Crea un singolo InfluxDB Point per un prezzo orario
 
-        # Tags (aggiunti year e month per query efficienti in history mode)
-        point.tag("source", source)
-        point.tag("market", market)
-        point.tag("hour", str(hour))
-        point.tag("year", str(ts_local.year))
-        point.tag("month", ts_local.strftime('%B'))
-        point.tag("day", str(ts_local.day))
+        Args:
+            hour: Ora GME (1..25)
+            pun_mwh: Prezzo in €/MWh
+            source: Fonte dati (es. "GME")
+            market: Mercato (es. "MGP")
+            ctx: Contesto del giorno del prezzo (tag e timestamp precalcolati)
 
-        # Fields (manteniamo i nomi standard PUN del mercato elettrico)
-        # Salviamo solo MWh come richiesto (valore originale)
-        point.field("pun_mwh", float(pun_mwh))
+        Returns:
+            InfluxDB Point object
+        """
+        year_str, month_name, day_str, ts_sec = self._resolve_gme_row(hour, ctx)
+
+        # Point costruito in una sola chiamata invece di una catena tag()/field()/time()
+        return Point.from_dict({
+            'measurement': "gme_prices",
+            # Tags (aggiunti year e month per query efficienti in history mode)
+            'tags': {
+                'source': source,
+                'market': market,
+                'hour': _HOUR_LOOKUP[hour - 1][0],
+                'year': year_str,
+                'month': month_name,
+                'day': day_str,
+            },
+            # Fields (manteniamo i nomi standard PUN del mercato elettrico)
+            # Salviamo solo MWh come richiesto (valore originale)
+            'fields': {'pun_mwh': pun_mwh},
+            'time': ts_sec,
+        }, write_precision=WritePrecision.S)
+
+    def _create_gme_line(self, hour: int, pun_mwh: float, source: str, market: str,
+                         ctx: _DayContext) -> str:
+        """
+        Crea una riga line protocol per un prezzo orario (stessi tag/field di _create_gme_point)
 
-        # Timestamp
-        point.time(ts_ns, WritePrecision.NS)
+        Returns:
+            Riga line protocol con timestamp in secondi (GME_LINE_PRECISION)
+        """
+        year_str, month_name, day_str, ts_sec = self._resolve_gme_row(hour, ctx)
 
-        return point
+        # Tag in ordine alfabetico, come serializzati da Point
+        return (f"gme_prices,day={day_str},hour={_HOUR_LOOKUP[hour - 1][0]},market={escape_tag(market)},"
+                f"month={escape_tag(month_name)},source={escape_tag(source)},year={year_str} "
+                f"pun_mwh={format_float(pun_mwh)} {ts_sec}")
 
-    def create_monthly_avg_point(self, prices: List[float], date: datetime) -> Optional[Point]:
+    def create_monthly_avg_point(self, prices: Sequence[float], date: datetime) -> Optional[Point]:
         """
         Crea un punto per la media mensile da una lista di prezzi
 
         Args:
-            prices: Lista di prezzi in €/kWh
+            prices: Sequenza di prezzi in €/kWh (lista, tupla o array)
             date: Data di riferimento (usata per anno/mese)
 
         Returns:
             InfluxDB Point o None se lista vuota
         """
-        if not prices:
+        if len(prices) == 0:
             return None
 
-        avg_kwh = round(sum(prices) / len(prices), 3)
+        # fsum: somma in un solo passaggio C, senza accumulo di errori su migliaia di ore
+        avg_kwh = round(math.fsum(prices) / len(prices), 3)
 
         # Create monthly average point
         monthly_point = Point("gme_monthly_avg")
-        monthly_point.tag("source", "GME")
-        monthly_point.tag("market", "MGP")
+        monthly_point.tag("source", _SOURCE_GME)
+        monthly_point.tag("market", _MARKET_MGP)
         monthly_point.tag("year", str(date.year))
-        monthly_point.tag("month", date.strftime('%B'))
+        monthly_point.tag("month", _MONTHS_EN[date.month])
 
         # Solo €/kWh come richiesto
         monthly_point.field("pun_kwh_avg", float(avg_kwh))
 
-        # Use first day of month as timestamp
-        first_day = datetime(date.year, date.month, 1)
-        ts_aware = self.timezone.localize(first_day)
-        ts_utc = ts_aware.astimezone(pytz.utc)
-        ts_ns = int(ts_utc.timestamp() * 1_000_000_000)
-        monthly_point.time(ts_ns, WritePrecision.NS)
+        # Use first day of month as timestamp (localizzato una sola volta per mese)
+        month_key = (date.year, date.month)
+        ts_sec = self._month_ts_cache.get(month_key)
+        if ts_sec is None:
+            first_day = datetime(date.year, date.month, 1)
+            ts_aware = self._localize(first_day)
+            ts_utc = ts_aware.astimezone(dt_timezone.utc)
+            # timegm: percorso intero, senza passare dai secondi float di timestamp()
+            ts_sec = calendar.timegm(ts_utc.utctimetuple())
+            self._month_ts_cache[month_key] = ts_sec
+        monthly_point.time(ts_sec, WritePrecision.S)
 
         logger.info(f"📊 PUN medio mensile calcolato: {avg_kwh:.6f} €/kWh ({len(prices)} ore)")
         return monthly_point
 
 
+if not INFLUX_AVAILABLE:
+    # Senza influxdb_client i metodi che costruiscono Point vengono sostituiti una volta
+    # sola all'import, invece di verificare la disponibilità ad ogni chiamata.
+    # parse_line_protocol() resta utilizzabile: non dipende dal client.
+    def _parse_unavailable(self, gme_data: Dict[str, Any]) -> List[Any]:
+        logger.error("InfluxDB client non disponibile, impossibile creare Points")
+        return []
+
+    def _monthly_avg_unavailable(self, prices: Sequence[float], date: datetime) -> None:
+        logger.error("InfluxDB client non disponibile, impossibile creare Points")
+        return None
+
+    GMEParser.parse = _parse_unavailable
+    GMEParser.create_monthly_avg_point = _monthly_avg_unavailable
+
 
 def create_parser(timezone: str = 'Europe/Rome') -> GMEParser:
     """Factory function per creare un parser GME"""
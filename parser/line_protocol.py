@@ -0,0 +1,97 @@
+"""line_protocol.py - Formattazione diretta InfluxDB line protocol
+Usato dai parser ad alto volume per evitare la costruzione di Point objects.
+Escaping e formattazione dei valori allineati a influxdb_client.Point.to_line_protocol().
+"""
+
+import math
+from typing import Dict
+
+# Precisione dei timestamp nelle righe generate dai parser
+LINE_PROTOCOL_PRECISION = 'ns'
+
+# Fattore di conversione in nanosecondi per ogni precisione InfluxDB
+_NS_PER_UNIT = {'s': 1_000_000_000, 'ms': 1_000_000, 'us': 1_000, 'ns': 1}
+
+_ESCAPE_TAG = str.maketrans({
+    ',': r'\,',
+    '=': r'\=',
+    ' ': r'\ ',
+    '\n': r'\n',
+    '\t': r'\t',
+    '\r': r'\r',
+})
+
+_ESCAPE_STRING = str.maketrans({
+    '"': r'\"',
+    '\\': r'\\',
+})
+
+
+def escape_tag(value: str) -> str:
+    """Escape di chiave o valore tag (virgola, uguale, spazio, caratteri di controllo)"""
+    escaped = str(value).translate(_ESCAPE_TAG)
+    if escaped.endswith('\\'):
+        escaped += ' '
+    return escaped
+
+
+def format_tags(tags: Dict[str, str]) -> str:
+    """Formatta i tag come ',k=v,...' ordinati per chiave, omettendo i valori vuoti"""
+    parts = []
+    for key, value in sorted(tags.items()):
+        if value is None:
+            continue
+        escaped = escape_tag(value)
+        if escaped:
+            parts.append(f",{escape_tag(key)}={escaped}")
+    return ''.join(parts)
+
+
+def format_float(value: float) -> str:
+    """Formatta un field float (senza '.0' finale, come influxdb_client)
+
+    Raises:
+        ValueError: Se il valore non è finito (NaN/inf non sono ammessi nel line protocol)
+    """
+    if not math.isfinite(value):
+        raise ValueError(f"Valore non finito non rappresentabile: {value}")
+    text = str(float(value))
+    return text[:-2] if text.endswith('.0') else text
+
+
+def format_string(value: str) -> str:
+    """Formatta un field stringa tra doppi apici con escape"""
+    return f'"{str(value).translate(_ESCAPE_STRING)}"'
+
+
+def measurement_of(line: str) -> str:
+    """Estrae il measurement da una riga line protocol"""
+    end = len(line)
+    for separator in (',', ' '):
+        index = line.find(separator)
+        if 0 <= index < end:
+            end = index
+    return line[:end]
+
+
+def timestamp_to_ns(line: str, precision: str) -> str:
+    """Riporta in nanosecondi il timestamp finale di una riga scritta con la precisione indicata
+
+    Le righe senza timestamp vengono restituite invariate.
+    """
+    factor = _NS_PER_UNIT[str(precision)]
+    head, _, timestamp = line.rpartition(' ')
+    if factor == 1 or not head or not timestamp.lstrip('-').isdigit():
+        return line
+    return f"{head} {int(timestamp) * factor}"
+
+
+__all__ = [
+    "LINE_PROTOCOL_PRECISION",
+    "escape_tag",
+    "format_tags",
+    "format_float",
+    "format_string",
+    "measurement_of",
+    "timestamp_to_ns",
+]
@@ -1,41 +1,208 @@
 #!/usr/bin/env python3
 """Parser per output formattato realtime SolarEdge."""
 
-import re
+import logging
+import math
+import sys
 import time
-from typing import List
-from datetime import datetime, timezone
-from influxdb_client import Point
+from types import MappingProxyType
+from typing import Callable, Dict, Iterator, List, Mapping, NamedTuple, Optional
 from app_logging import get_logger
 from config.config_manager import get_config_manager
+from parser.line_protocol import format_float, format_string, format_tags
+
+# Mappa speciale meters per scale factor che non seguono pattern standard
+# Esempio: import_energy_active -> energy_active_scale
+# Costruita una volta all'import e resa di sola lettura
+_METER_SPECIAL_SCALE_KEYS = MappingProxyType({
+    'import_energy_active': 'energy_active_scale',
+    'export_energy_active': 'energy_active_scale',
+    'l1_import_energy_active': 'energy_active_scale',
+    'l2_import_energy_active': 'energy_active_scale',
+    'l3_import_energy_active': 'energy_active_scale',
+    'l1_export_energy_active': 'energy_active_scale',
+    'l2_export_energy_active': 'energy_active_scale',
+    'l3_export_energy_active': 'energy_active_scale',
+
+    'import_energy_apparent': 'energy_apparent_scale',
+    'export_energy_apparent': 'energy_apparent_scale',
+    'l1_import_energy_apparent': 'energy_apparent_scale',
+    'l2_import_energy_apparent': 'energy_apparent_scale',
+    'l3_import_energy_apparent': 'energy_apparent_scale',
+    'l1_export_energy_apparent': 'energy_apparent_scale',
+    'l2_export_energy_apparent': 'energy_apparent_scale',
+    'l3_export_energy_apparent': 'energy_apparent_scale',
+
+    'import_energy_reactive_q1': 'energy_reactive_scale',
+    'import_energy_reactive_q2': 'energy_reactive_scale',
+    'export_energy_reactive_q3': 'energy_reactive_scale',
+    'export_energy_reactive_q4': 'energy_reactive_scale',
+    'l1_import_energy_reactive_q1': 'energy_reactive_scale',
+    'l1_import_energy_reactive_q2': 'energy_reactive_scale',
+    'l1_export_energy_reactive_q3': 'energy_reactive_scale',
+    'l1_export_energy_reactive_q4': 'energy_reactive_scale',
+    'l2_import_energy_reactive_q1': 'energy_reactive_scale',
+    'l2_import_energy_reactive_q2': 'energy_reactive_scale',
+    'l2_export_energy_reactive_q3': 'energy_reactive_scale',
+    'l2_export_energy_reactive_q4': 'energy_reactive_scale',
+    'l3_import_energy_reactive_q1': 'energy_reactive_scale',
+    'l3_import_energy_reactive_q2': 'energy_reactive_scale',
+    'l3_export_energy_reactive_q3': 'energy_reactive_scale',
+    'l3_export_energy_reactive_q4': 'energy_reactive_scale',
+
+    'voltage_ln': 'voltage_scale',
+    'l1n_voltage': 'voltage_scale',
+    'l2n_voltage': 'voltage_scale',
+    'l3n_voltage': 'voltage_scale',
+    'voltage_ll': 'voltage_scale',
+    'l12_voltage': 'voltage_scale',
+    'l23_voltage': 'voltage_scale',
+    'l31_voltage': 'voltage_scale',
+
+    'frequency': 'frequency_scale',
+
+    'power': 'power_scale',
+    'l1_power': 'power_scale',
+    'l2_power': 'power_scale',
+    'l3_power': 'power_scale',
+
+    'power_apparent': 'power_apparent_scale',
+    'l1_power_apparent': 'power_apparent_scale',
+    'l2_power_apparent': 'power_apparent_scale',
+    'l3_power_apparent': 'power_apparent_scale',
+
+    'power_reactive': 'power_reactive_scale',
+    'l1_power_reactive': 'power_reactive_scale',
+    'l2_power_reactive': 'power_reactive_scale',
+    'l3_power_reactive': 'power_reactive_scale',
+
+    'power_factor': 'power_factor_scale',
+    'l1_power_factor': 'power_factor_scale',
+    'l2_power_factor': 'power_factor_scale',
+    'l3_power_factor': 'power_factor_scale',
+
+    'current': 'current_scale',
+    'l1_current': 'current_scale',
+    'l2_current': 'current_scale',
+    'l3_current': 'current_scale'
+})
+
+# Potenze di 10 per gli scale factor SunSpec (-16..16), indicizzate per scale + 16
+_POW10_OFFSET = 16
+_POW10 = tuple(10.0 ** exponent for exponent in range(-_POW10_OFFSET, _POW10_OFFSET + 1))
+
+# Mappa di normalizzazione unità (abbreviazioni → forma completa)
+_UNIT_NORMALIZATION = {
+    'C': '°C',
+    'F': '°F'
+}
+
+
+class _DeviceKind(NamedTuple):
+    """Specifica di un tipo di dispositivo realtime (inverter, meters, batteries)."""
+    # Chiave nei dati raw del collector
+    raw_key: str
+    # Sezione in modbus_endpoints.yaml
+    section: str
+    # Field numerico (Inverter, Meter, Battery); il testo usa '<field>_Text'
+    field_name: str
+    # True se i dati sono {nome_dispositivo: registri}, False per un solo dispositivo
+    multi_device: bool
+    # Risolve il device_id di un dispositivo non ancora in cache, da (nome, registri, cache del tipo);
+    # lo memorizza nella cache del tipo e restituisce None se non disponibile
+    resolve_device_id: Callable[[str, dict, Dict[str, str]], Optional[str]]
+    # Mappa chiave → scale factor non standard (solo meters)
+    special_scale_keys: Optional[Mapping[str, str]] = None
+    # Compensazione bug firmware di energy_total (solo inverter)
+    compensate_energy_total: bool = False
+
+
+class _SectionConfig(NamedTuple):
+    """Configurazione derivata di una sezione di modbus_endpoints.yaml."""
+    # Sezione abilitata in configurazione
+    enabled: bool
+    # Chiavi raw abilitate (con e senza prefisso c_) con relative info
+    # (clean_key, tag endpoint/unit, chiave scale, chiave scale di fallback); vuota se nessuna misura è configurata
+    enabled_keys: tuple
 
 
 class RealtimeParser:
-    """Parser per output formattato realtime."""
+    """Parser per output formattato realtime.
+
+    Le tabelle derivate dalla configurazione modbus (_SectionConfig per sezione) sono
+    condivise tra tutte le istanze tramite _shared_section_cache: il flusso realtime crea
+    un parser ad ogni lettura e finché il loader YAML restituisce lo stesso oggetto
+    (file non modificato) le tabelle non vengono ricalcolate. Le tabelle condivise sono
+    di sola lettura; le info delle chiavi non configurate vengono derivate per istanza.
+    """
+
+    # Attributi fissi: accesso via slot invece che tramite __dict__ nel parsing per valore
+    __slots__ = ('_log', '_config_manager', '_modbus_endpoints', '_section_cache', '_cached_device_ids',
+                 '_device_kinds', '_device_tags_cache', '_derived_key_info')
+
+    # (configurazione endpoints, cache per sezione) dell'ultima derivazione, condivisa tra istanze
+    _shared_section_cache: Optional[tuple] = None
 
     def __init__(self):
         self._log = get_logger(__name__)
         self._config_manager = get_config_manager()
 
-        # Carica configurazione endpoints modbus
-        try:
-            self._modbus_endpoints = self._config_manager.get_modbus_endpoints()
-        except Exception as e:
-            self._log.error(f"Errore caricamento configurazione modbus: {e}")
-            raise
+        # Tipi di dispositivo: un'unica routine di parsing guidata da queste specifiche
+        self._device_kinds = (
+            _DeviceKind("inverter", 'inverter_realtime', "Inverter", False, self._resolve_inverter_id,
+                        compensate_energy_total=True),
+            _DeviceKind("meters", 'meters', "Meter", True, self._resolve_meter_id,
+                        special_scale_keys=_METER_SPECIAL_SCALE_KEYS),
+            _DeviceKind("batteries", 'batteries', "Battery", True, self._resolve_battery_id),
+        )
+
+        # Carica configurazione endpoints modbus e cache derivate per sezione
+        self._load_section_cache()
 
-        # Cache per device_id dinamici
+        # Info delle chiavi raw non configurate, derivate alla prima lettura: {sezione: {chiave raw: info}}
+        self._derived_key_info: Dict[str, Dict[str, tuple]] = {kind.section: {} for kind in self._device_kinds}
+
+        # Cache per device_id dinamici: {tipo: {nome dispositivo: device_id}}
         self._cached_device_ids = {
-            'inverter': None,
+            'inverter': {},
             'meters': {},
             'batteries': {}
         }
 
-        # Mappa di normalizzazione unità (abbreviazioni → forma completa)
-        self._unit_normalization = {
-            'C': '°C',
-            'F': '°F'
-        }
+        # Measurement e tag device_id già formattati, per device_id
+        self._device_tags_cache: Dict[str, str] = {}
+
+    def _load_section_cache(self) -> None:
+        """Carica la configurazione modbus e le cache derivate per sezione.
+
+        Le misure abilitate vengono calcolate qui una volta sola invece che ad ogni
+        parsing. Se il loader YAML restituisce lo stesso oggetto dell'ultima derivazione
+        (file non modificato) riusa le tabelle condivise tra istanze senza ricalcolo.
+        """
+        try:
+            self._modbus_endpoints = self._config_manager.get_modbus_endpoints()
+        except Exception as e:
+            self._log.error(f"Errore caricamento configurazione modbus: {e}")
+            raise
+
+        shared = RealtimeParser._shared_section_cache
+        if shared is not None and shared[0] is self._modbus_endpoints:
+            self._section_cache = shared[1]
+            return
+
+        # {sezione: _SectionConfig}
+        endpoints = self._modbus_endpoints.get('endpoints', {})
+        self._section_cache = {}
+        for kind in self._device_kinds:
+            section_config = endpoints.get(kind.section, {})
+            enabled_measurements = self._get_enabled_measurements(section_config)
+            key_info = self._build_key_info(enabled_measurements, kind.special_scale_keys)
+            self._section_cache[kind.section] = _SectionConfig(
+                enabled=bool(section_config.get('enabled', False)),
+                # Tupla immutabile: la tabella è condivisa tra istanze
+                enabled_keys=tuple(key_info.items())
+            )
+        RealtimeParser._shared_section_cache = (self._modbus_endpoints, self._section_cache)
 
     def _get_enabled_measurements(self, endpoint_config: dict) -> dict:
         """Ottieni measurements abilitati da configurazione endpoint.
@@ -50,348 +217,329 @@ class RealtimeParser:
         return {name: config for name, config in measurements.items()
                 if config.get('enabled', False)}
 
-    def parse_raw_data(self, raw_data: dict) -> List[Point]:
-        """Parse dati raw da dizionario strutturato."""
+    @staticmethod
+    def _default_endpoint_info(clean_key: str) -> str:
+        """Tag endpoint (Title Case automatico) senza unità per misure non configurate."""
+        return sys.intern(format_tags({"endpoint": clean_key.replace('_', ' ').title()}))
+
+    @staticmethod
+    def _build_endpoint_info(enabled_measurements: dict) -> dict:
+        """Precalcola i tag endpoint/unit delle misure abilitate, una volta per sezione.
+
+        Args:
+            enabled_measurements: Measurements abilitati {measurement_name: config}
+
+        Returns:
+            Dizionario {measurement_name: ',endpoint=...,unit=...'} già in formato line protocol
+        """
+        endpoint_info = {}
+        for name, config in enabled_measurements.items():
+            unit = config.get('unit', '')
+            # Normalizza unità (C → °C, F → °F)
+            endpoint_info[name] = sys.intern(format_tags({
+                "endpoint": name.replace('_', ' ').title(),
+                "unit": _UNIT_NORMALIZATION.get(unit, unit)
+            }))
+        return endpoint_info
+
+    @staticmethod
+    def _scale_keys(key: str, clean_key: str, special_scale_keys: Optional[Mapping[str, str]]) -> tuple:
+        """Chiave dello scale factor di un registro e relativo fallback, risolti una volta per chiave.
+
+        Args:
+            key: Chiave raw del registro
+            clean_key: Chiave senza prefisso c_
+            special_scale_keys: Mappa scale factor non standard del tipo di dispositivo (o None)
+
+        Returns:
+            Tupla (chiave scale, chiave scale standard di fallback o None se coincidono)
+        """
+        default_scale_key = sys.intern(f"{key}_scale")
+        if special_scale_keys:
+            special_scale_key = special_scale_keys.get(clean_key)
+            if special_scale_key is not None and special_scale_key != default_scale_key:
+                return sys.intern(special_scale_key), default_scale_key
+        return default_scale_key, None
+
+    @classmethod
+    def _build_key_info(cls, enabled_measurements: dict,
+                        special_scale_keys: Optional[Mapping[str, str]] = None) -> dict:
+        """Precalcola le info delle chiavi raw delle misure abilitate (con e senza prefisso c_).
+
+        Args:
+            enabled_measurements: Measurements abilitati {measurement_name: config}
+            special_scale_keys: Mappa scale factor non standard del tipo di dispositivo (o None)
+
+        Returns:
+            Dizionario {raw_key: (clean_key, tag endpoint/unit, chiave scale, chiave scale di fallback)}
+        """
+        key_info = {}
+        for name, endpoint_tags in cls._build_endpoint_info(enabled_measurements).items():
+            prefixed_key = f"c_{name}"
+            key_info[prefixed_key] = (name, endpoint_tags,
+                                      *cls._scale_keys(prefixed_key, name, special_scale_keys))
+            if not name.startswith('c_'):
+                key_info[name] = (name, endpoint_tags, *cls._scale_keys(name, name, special_scale_keys))
+        return key_info
+
+    @classmethod
+    def _derive_key_info(cls, key: str, special_scale_keys: Optional[Mapping[str, str]] = None) -> tuple:
+        """Info di una chiave raw senza misure abilitate configurate (tag endpoint di default).
+
+        Args:
+            key: Chiave raw del registro
+            special_scale_keys: Mappa scale factor non standard del tipo di dispositivo (o None)
+
+        Returns:
+            Tupla (clean_key, tag endpoint, chiave scale, chiave scale di fallback)
+        """
+        # Slice + confronto invece della chiamata a metodo startswith
+        clean_key = key[2:] if key[:2] == 'c_' else key
+        return (clean_key, cls._default_endpoint_info(clean_key),
+                *cls._scale_keys(key, clean_key, special_scale_keys))
+
+    def _device_tags(self, device_id: str) -> str:
+        """Measurement e tag device_id, comuni a tutti i punti di un dispositivo (formattati una volta)."""
+        device_tags = self._device_tags_cache.get(device_id)
+        if device_tags is None:
+            device_tags = sys.intern(f"realtime{format_tags({'device_id': device_id})}")
+            self._device_tags_cache[device_id] = device_tags
+        return device_tags
+
+    @staticmethod
+    def _build_line(device_tags: str, endpoint_tags: str, field_name: str,
+                    value: float, now: int) -> Optional[str]:
+        """Costruisce direttamente la riga line protocol di un punto realtime numerico.
+
+        I tag sono ordinati per chiave (device_id < endpoint < unit): lo scheletro
+        precalcolato per dispositivo e per misura viene solo concatenato.
+
+        Args:
+            device_tags: Measurement e tag device_id (da _device_tags)
+            endpoint_tags: Tag endpoint/unit (da _build_endpoint_info)
+            field_name: Nome del field (es. Inverter)
+            value: Valore float
+            now: Timestamp in nanosecondi
+
+        Returns:
+            Riga line protocol, None se il valore non è finito (come Point, che lo scarta)
+        """
+        if not math.isfinite(value):
+            return None
+        return f"{device_tags}{endpoint_tags} {field_name}={format_float(value)} {now}"
+
+    @staticmethod
+    def _build_text_line(device_tags: str, endpoint_tags: str, field_name: str,
+                         value: str, now: int) -> str:
+        """Costruisce la riga line protocol di un punto realtime testuale (vedi _build_line).
+
+        Args:
+            device_tags: Measurement e tag device_id (da _device_tags)
+            endpoint_tags: Tag endpoint/unit (da _build_endpoint_info)
+            field_name: Nome del field (es. Meter_Text)
+            value: Valore testo
+            now: Timestamp in nanosecondi
+
+        Returns:
+            Riga line protocol
+        """
+        return f"{device_tags}{endpoint_tags} {field_name}={format_string(value)} {now}"
+
+    def parse_raw_data(self, raw_data: dict) -> List[str]:
+        """Parse dati raw da dizionario strutturato in righe InfluxDB line protocol (timestamp in ns)."""
         start_time = time.perf_counter()
         parsed_data = []
 
         if not raw_data:
             raise ValueError("Dati raw vuoti o None")
 
-        if "inverter" in raw_data:
-            parsed_data.extend(self._parse_inverter_raw(raw_data["inverter"]))
-
-        if "meters" in raw_data:
-            parsed_data.extend(self._parse_meters_raw(raw_data["meters"]))
+        # Timestamp unico di raccolta (ns) condiviso da tutti i punti di questa lettura
+        now = time.time_ns()
+
+        section_cache = self._section_cache
+
+        for kind in self._device_kinds:
+            # Sezioni disabilitate in configurazione: nessuna chiamata di parsing
+            if kind.raw_key not in raw_data or not section_cache[kind.section].enabled:
+                continue
+
+            section_data = raw_data[kind.raw_key]
+            if not isinstance(section_data, dict):
+                self._log.error(f"Errore parsing raw {kind.raw_key}: dati non validi ({type(section_data).__name__})")
+                continue
+
+            # Unico punto di cattura: un errore imprevisto salta solo la sezione coinvolta
+            try:
+                parsed_data.extend(self._parse_device_section(section_data, kind, now))
+            except Exception as e:
+                self._log.error(f"Errore parsing raw {kind.raw_key}: {e}")
+
+        # Messaggio ed extra costruiti solo se il livello INFO è attivo
+        if self._log.isEnabledFor(logging.INFO):
+            duration_ms = (time.perf_counter() - start_time) * 1000
+            self._log.info("Parsing raw completato: %d punti", len(parsed_data), extra={
+                "points_count": len(parsed_data),
+                "duration_ms": f"{duration_ms:.2f}"
+            })
+        return parsed_data
 
-        if "batteries" in raw_data:
-            parsed_data.extend(self._parse_batteries_raw(raw_data["batteries"]))
+    def _parse_device_section(self, section_data: dict, kind: _DeviceKind, now: int) -> List[str]:
+        """Parse dati raw di una sezione (uno o più dispositivi dello stesso tipo).
 
-        duration_ms = (time.perf_counter() - start_time) * 1000
-        self._log.info(f"Parsing raw completato: {len(parsed_data)} punti", extra={
-            "points_count": len(parsed_data),
-            "duration_ms": f"{duration_ms:.2f}"
-        })
-        return parsed_data
+        Args:
+            section_data: Registri del dispositivo, o {nome: registri} se kind.multi_device
+            kind: Specifica del tipo di dispositivo
+            now: Timestamp in nanosecondi
 
-    def _parse_inverter_raw(self, data: dict) -> List[Point]:
-        """Parse dati raw inverter."""
-        try:
-            endpoints = self._modbus_endpoints.get('endpoints', {})
-            inverter_config = endpoints.get('inverter_realtime', {})
-
-            if not inverter_config.get('enabled', False):
-                return []
-
-            # Cache-first: usa cache se disponibile, altrimenti aspetta c_model valido
-            cached_id = self._cached_device_ids.get('inverter')
-            c_model = data.get('c_model')
-
-            if cached_id:
-                device_id = cached_id
-            elif c_model:
-                device_id = c_model
-                self._cached_device_ids['inverter'] = device_id
-                self._log.info(f"Inverter device_id cached: {device_id}")
-            else:
-                # Nessun c_model valido e nessuna cache: salta questa lettura
-                self._log.warning("Inverter c_model not available, skipping this reading")
-                return []
-            enabled_measurements = self._get_enabled_measurements(inverter_config)
-
-            points = []
+        Returns:
+            Righe line protocol della sezione
+        """
+        devices = section_data.items() if kind.multi_device else ((kind.raw_key, section_data),)
+        id_cache = self._cached_device_ids[kind.raw_key]
+        points = []
 
-            for key, value in data.items():
-                clean_key = key[2:] if key.startswith('c_') else key
+        for name, data in devices:
+            if not isinstance(data, dict):
+                self._log.warning(f"{kind.field_name} {name} senza dati validi, skipping")
+                continue
 
-                if enabled_measurements and clean_key not in enabled_measurements:
+            # Cache-first comune a tutti i tipi: il resolver serve solo alla prima lettura valida
+            device_id = id_cache.get(name)
+            if device_id is None:
+                device_id = kind.resolve_device_id(name, data, id_cache)
+                if device_id is None:
                     continue
 
-                # Use automatic Title Case conversion for endpoint name
-                endpoint_name = clean_key.replace('_', ' ').title()
+            # Sezione abilitata già verificata da parse_raw_data
+            points.extend(self._iter_metric_lines(data, self._device_tags(device_id), kind, now))
 
-                scale_key = f"{key}_scale"
-                scale = data.get(scale_key)
+        return points
 
-                final_value = value
-                # Get unit from config if available
-                measurement_config = enabled_measurements.get(clean_key, {})
-                unit = measurement_config.get('unit', '')
-                # Normalizza unità (C → °C, F → °F)
-                unit = self._unit_normalization.get(unit, unit)
+    def _resolve_inverter_id(self, name: str, data: dict, id_cache: Dict[str, str]) -> Optional[str]:
+        """Device_id inverter da c_model, memorizzato in id_cache."""
+        c_model = data.get('c_model')
 
-                if isinstance(value, (int, float)) and scale is not None:
-                    try:
-                        if scale == -32768: continue
-
-                        # ENERGY COUNTER: Compensazione per bug firmware
-                        # Documentazione: energy_total_scale dovrebbe essere 0
-                        # Se scale=1, dividi per 10 per compensare
-                        if clean_key == 'energy_total':
-                            if scale == 1:
-                                final_value = value / 10
-                            else:
-                                # Per tutti gli altri scale (0, -1, -2, etc.), usa scaling standard
-                                final_value = value * (10 ** scale)
-                        else:
-                            final_value = value * (10 ** scale)
-                    except: continue
-
-                if isinstance(final_value, (int, float)):
-                    point = Point("realtime") \
-                        .tag("device_id", device_id) \
-                        .tag("endpoint", endpoint_name) \
-                        .tag("unit", unit) \
-                        .field("Inverter", float(final_value)) \
-                        .time(datetime.now(timezone.utc))
-                    points.append(point)
-                else:
-                    point = Point("realtime") \
-                        .tag("device_id", device_id) \
-                        .tag("endpoint", endpoint_name) \
-                        .tag("unit", unit) \
-                        .field("Inverter_Text", str(final_value)) \
-                        .time(datetime.now(timezone.utc))
-                    points.append(point)
-
-            return points
-        except Exception as e:
-            self._log.error(f"Errore parsing raw inverter: {e}")
-            return []
+        if c_model:
+            id_cache[name] = c_model
+            self._log.info(f"Inverter device_id cached: {c_model}")
+            return c_model
 
-    def _parse_meters_raw(self, meters_data: dict) -> List[Point]:
-        """Parse dati raw meters."""
-        points = []
-        try:
-            endpoints = self._modbus_endpoints.get('endpoints', {})
-            meters_config = endpoints.get('meters', {})
-
-            if not meters_config.get('enabled', False):
-                return []
-
-            enabled_measurements = self._get_enabled_measurements(meters_config)
-
-            for meter_name, data in meters_data.items():
-                # Cache-first: usa cache se disponibile, altrimenti aspetta serial/model valido
-                cached_id = self._cached_device_ids['meters'].get(meter_name)
-                serial = data.get('c_serialnumber')
-                c_model = data.get('c_model')
-
-                if cached_id:
-                    device_id = cached_id
-                elif serial:
-                    device_id = f"meter_{serial}"
-                    self._cached_device_ids['meters'][meter_name] = device_id
-                    self._log.info(f"Meter {meter_name} device_id cached: {device_id}")
-                elif c_model:
-                    device_id = c_model
-                    self._cached_device_ids['meters'][meter_name] = device_id
-                    self._log.info(f"Meter {meter_name} device_id cached: {device_id}")
-                else:
-                    # Nessun ID valido: salta questo meter
-                    self._log.warning(f"Meter {meter_name} has no valid ID, skipping")
-                    continue
+        # Nessun c_model valido e nessuna cache: salta questa lettura
+        self._log.warning("Inverter c_model not available, skipping this reading")
+        return None
 
-                for key, value in data.items():
-                    clean_key = key[2:] if key.startswith('c_') else key
+    def _resolve_meter_id(self, meter_name: str, data: dict, id_cache: Dict[str, str]) -> Optional[str]:
+        """Device_id meter da serial (meter_<serial>), altrimenti c_model, memorizzato in id_cache."""
+        serial = data.get('c_serialnumber')
+        c_model = data.get('c_model')
 
-                    if enabled_measurements and clean_key not in enabled_measurements:
-                        continue
+        if serial:
+            device_id = f"meter_{serial}"
+        elif c_model:
+            device_id = c_model
+        else:
+            # Nessun ID valido: salta questo meter
+            self._log.warning(f"Meter {meter_name} has no valid ID, skipping")
+            return None
 
-                    endpoint_name = clean_key.replace('_', ' ').title()
-
-                    # Mappa speciale per scale factor che non seguono pattern standard
-                    # Esempio: import_energy_active -> energy_active_scale
-                    special_scale_keys = {
-                        'import_energy_active': 'energy_active_scale',
-                        'export_energy_active': 'energy_active_scale',
-                        'l1_import_energy_active': 'energy_active_scale',
-                        'l2_import_energy_active': 'energy_active_scale',
-                        'l3_import_energy_active': 'energy_active_scale',
-                        'l1_export_energy_active': 'energy_active_scale',
-                        'l2_export_energy_active': 'energy_active_scale',
-                        'l3_export_energy_active': 'energy_active_scale',
-
-                        'import_energy_apparent': 'energy_apparent_scale',
-                        'export_energy_apparent': 'energy_apparent_scale',
-                        'l1_import_energy_apparent': 'energy_apparent_scale',
-                        'l2_import_energy_apparent': 'energy_apparent_scale',
-                        'l3_import_energy_apparent': 'energy_apparent_scale',
-                        'l1_export_energy_apparent': 'energy_apparent_scale',
-                        'l2_export_energy_apparent': 'energy_apparent_scale',
-                        'l3_export_energy_apparent': 'energy_apparent_scale',
-
-                        'import_energy_reactive_q1': 'energy_reactive_scale',
-                        'import_energy_reactive_q2': 'energy_reactive_scale',
-                        'export_energy_reactive_q3': 'energy_reactive_scale',
-                        'export_energy_reactive_q4': 'energy_reactive_scale',
-                        'l1_import_energy_reactive_q1': 'energy_reactive_scale',
-                        'l1_import_energy_reactive_q2': 'energy_reactive_scale',
-                        'l1_export_energy_reactive_q3': 'energy_reactive_scale',
-                        'l1_export_energy_reactive_q4': 'energy_reactive_scale',
-                        'l2_import_energy_reactive_q1': 'energy_reactive_scale',
-                        'l2_import_energy_reactive_q2': 'energy_reactive_scale',
-                        'l2_export_energy_reactive_q3': 'energy_reactive_scale',
-                        'l2_export_energy_reactive_q4': 'energy_reactive_scale',
-                        'l3_import_energy_reactive_q1': 'energy_reactive_scale',
-                        'l3_import_energy_reactive_q2': 'energy_reactive_scale',
-                        'l3_export_energy_reactive_q3': 'energy_reactive_scale',
-                        'l3_export_energy_reactive_q4': 'energy_reactive_scale',
-
-                        'voltage_ln': 'voltage_scale',
-                        'l1n_voltage': 'voltage_scale',
-                        'l2n_voltage': 'voltage_scale',
-                        'l3n_voltage': 'voltage_scale',
-                        'voltage_ll': 'voltage_scale',
-                        'l12_voltage': 'voltage_scale',
-                        'l23_voltage': 'voltage_scale',
-                        'l31_voltage': 'voltage_scale',
-
-                        'frequency': 'frequency_scale',
-
-                        'power': 'power_scale',
-                        'l1_power': 'power_scale',
-                        'l2_power': 'power_scale',
-                        'l3_power': 'power_scale',
-
-                        'power_apparent': 'power_apparent_scale',
-                        'l1_power_apparent': 'power_apparent_scale',
-                        'l2_power_apparent': 'power_apparent_scale',
-                        'l3_power_apparent': 'power_apparent_scale',
-
-                        'power_reactive': 'power_reactive_scale',
-                        'l1_power_reactive': 'power_reactive_scale',
-                        'l2_power_reactive': 'power_reactive_scale',
-                        'l3_power_reactive': 'power_reactive_scale',
-
-                        'power_factor': 'power_factor_scale',
-                        'l1_power_factor': 'power_factor_scale',
-                        'l2_power_factor': 'power_factor_scale',
-                        'l3_power_factor': 'power_factor_scale',
-
-                        'current': 'current_scale',
-                        'l1_current': 'current_scale',
-                        'l2_current': 'current_scale',
-                        'l3_current': 'current_scale'
-                    }
-
-                    scale_key = special_scale_keys.get(clean_key, f"{key}_scale")
-                    scale = data.get(scale_key)
-
-                    # Fallback: se non trovato, prova con suffisso _scale standard
-                    if scale is None and f"{key}_scale" in data:
-                        scale = data.get(f"{key}_scale")
-
-                    # DEBUG GENERALE: Logga tutto per capire cosa arriva
-                    # if 'energy' in clean_key and 'scale' not in clean_key:
-                    #      print(f"DEBUG ALL: {clean_key} raw={value} scale_key={scale_key} scale={scale}", flush=True)
-
-                    final_value = value
-                    # Get unit from config if available
-                    measurement_config = enabled_measurements.get(clean_key, {})
-                    unit = measurement_config.get('unit', '')
-                    # Normalizza unità (C → °C, F → °F)
-                    unit = self._unit_normalization.get(unit, unit)
-
-                    if isinstance(value, (int, float)) and scale is not None:
-                        try:
-                            if scale == -32768: continue
-
-                            # Scaling standard: value * (10 ^ scale)
-                            # Come richiesto, usiamo rigorosamente lo scale factor riportato dal dispositivo
-                            final_value = value * (10 ** scale)
-                        except: continue
-
-                    if isinstance(final_value, (int, float)):
-                        point = Point("realtime") \
-                            .tag("device_id", device_id) \
-                            .tag("endpoint", endpoint_name) \
-                            .tag("unit", unit) \
-                            .field("Meter", float(final_value)) \
-                            .time(datetime.now(timezone.utc))
-                        points.append(point)
-                    else:
-                        point = Point("realtime") \
-                            .tag("device_id", device_id) \
-                            .tag("endpoint", endpoint_name) \
-                            .tag("unit", unit) \
-                            .field("Meter_Text", str(final_value)) \
-                            .time(datetime.now(timezone.utc))
-                        points.append(point)
-        except Exception as e:
-            self._log.error(f"Errore parsing raw meters: {e}")
+        id_cache[meter_name] = device_id
+        self._log.info(f"Meter {meter_name} device_id cached: {device_id}")
+        return device_id
 
-        return points
+    def _resolve_battery_id(self, battery_name: str, data: dict, id_cache: Dict[str, str]) -> Optional[str]:
+        """Device_id battery da c_model, memorizzato in id_cache."""
+        c_model = data.get('c_model')
 
-    def _parse_batteries_raw(self, batteries_data: dict) -> List[Point]:
-        """Parse dati raw batteries."""
-        points = []
-        try:
-            endpoints = self._modbus_endpoints.get('endpoints', {})
-            batteries_config = endpoints.get('batteries', {})
+        if c_model:
+            id_cache[battery_name] = c_model
+            self._log.info(f"Battery {battery_name} device_id cached: {c_model}")
+            return c_model
 
-            if not batteries_config.get('enabled', False):
-                return []
+        # Nessun c_model valido: salta questa battery
+        self._log.warning(f"Battery {battery_name} has no valid c_model, skipping")
+        return None
 
-            enabled_measurements = self._get_enabled_measurements(batteries_config)
+    def _iter_metric_lines(self, data: dict, device_tags: str, kind: _DeviceKind, now: int) -> Iterator[str]:
+        """Genera le righe line protocol dei valori di un singolo dispositivo.
 
-            for battery_name, data in batteries_data.items():
-                # Cache-first: usa cache se disponibile, altrimenti aspetta c_model valido
-                cached_id = self._cached_device_ids['batteries'].get(battery_name)
-                c_model = data.get('c_model')
+        Ciclo condiviso da inverter, meters e batteries: field, mappa degli scale
+        factor e compensazione energy_total arrivano dalla specifica del tipo.
 
-                if cached_id:
-                    device_id = cached_id
-                elif c_model:
-                    device_id = c_model
-                    self._cached_device_ids['batteries'][battery_name] = device_id
-                    self._log.info(f"Battery {battery_name} device_id cached: {device_id}")
-                else:
-                    # Nessun c_model valido: salta questa battery
-                    self._log.warning(f"Battery {battery_name} has no valid c_model, skipping")
-                    continue
+        Args:
+            data: Registri raw del dispositivo {chiave: valore}
+            device_tags: Measurement e tag device_id (da _device_tags)
+            kind: Specifica del tipo di dispositivo
+            now: Timestamp in nanosecondi
 
-                for key, value in data.items():
-                    clean_key = key[2:] if key.startswith('c_') else key
-
-                    if enabled_measurements and clean_key not in enabled_measurements:
-                        if enabled_measurements:
-                            continue
-                    endpoint_name = clean_key.replace('_', ' ').title()
-
-                    scale_key = f"{key}_scale"
-                    scale = data.get(scale_key)
-
-                    final_value = value
-                    # Get unit from config if available
-                    measurement_config = enabled_measurements.get(clean_key, {})
-                    unit = measurement_config.get('unit', '')
-                    # Normalizza unità (C → °C, F → °F)
-                    unit = self._unit_normalization.get(unit, unit)
-
-                    if isinstance(value, (int, float)) and scale is not None:
-                        try:
-                            if scale == -32768: continue
-                            final_value = value * (10 ** scale)
-                        except: continue
-
-                    if isinstance(final_value, (int, float)):
-                        point = Point("realtime") \
-                            .tag("device_id", device_id) \
-                            .tag("endpoint", endpoint_name) \
-                            .tag("unit", unit) \
-                            .field("Battery", float(final_value)) \
-                            .time(datetime.now(timezone.utc))
-                        points.append(point)
-                    else:
-                        point = Point("realtime") \
-                            .tag("device_id", device_id) \
-                            .tag("endpoint", endpoint_name) \
-                            .tag("unit", unit) \
-                            .field("Battery_Text", str(final_value)) \
-                            .time(datetime.now(timezone.utc))
-                        points.append(point)
-        except Exception as e:
-            self._log.error(f"Errore parsing raw batteries: {e}")
+        Yields:
+            Righe line protocol
+        """
+        enabled_keys = self._section_cache[kind.section].enabled_keys
+        field_name = kind.field_name
+        compensate_energy_total = kind.compensate_energy_total
+        text_field_name = f"{field_name}_Text"
+        # Attributi e globali usati per ogni valore, legati a variabili locali
+        data_get = data.get
+        build_line = self._build_line
+        build_text_line = self._build_text_line
+        pow10 = _POW10
+        pow10_offset = _POW10_OFFSET
+
+        if enabled_keys:
+            # Solo le chiavi abilitate: lookup diretto invece di scorrere e scartare tutti i registri
+            entries = [(data[key], info) for key, info in enabled_keys if key in data]
+        else:
+            # Nessuna misura configurata: tutte le chiavi tranne gli scale factor (consumati
+            # dal valore cui si riferiscono), info derivate una volta per istanza e memorizzate
+            derived_key_info = self._derived_key_info[kind.section]
+            entries = []
+            for key, value in data.items():
+                if key.endswith('_scale'):
+                    continue
+                info = derived_key_info.get(key)
+                if info is None:
+                    info = derived_key_info[key] = self._derive_key_info(key, kind.special_scale_keys)
+                entries.append((value, info))
+
+        for value, (clean_key, endpoint_tags, scale_key, fallback_scale_key) in entries:
+            # Tipo deciso una volta sola: rami numerico e testuale disgiunti.
+            # Confronto diretto sui tipi esatti, isinstance solo per sottoclassi (es. bool)
+            value_type = type(value)
+            if not (value_type is float or value_type is int or isinstance(value, (int, float))):
+                # Stringhe (caso tipico dei registri testuali) passano senza conversione
+                text = value if value_type is str else str(value)
+                yield build_text_line(device_tags, endpoint_tags, text_field_name, text, now)
+                continue
+
+            # Chiave scale già risolta (mappa speciale meters inclusa) nella tabella delle chiavi
+            scale = data_get(scale_key)
+
+            # Fallback: se lo scale factor speciale manca, prova con suffisso _scale standard
+            if scale is None and fallback_scale_key is not None:
+                scale = data_get(fallback_scale_key)
+
+            final_value = value
+            if scale is not None:
+                if scale == -32768: continue
+
+                # ENERGY COUNTER: Compensazione per bug firmware
+                # Documentazione: energy_total_scale dovrebbe essere 0
+                # Se scale=1, dividi per 10 per compensare
+                if compensate_energy_total and scale == 1 and clean_key == 'energy_total':
+                    final_value = value / 10
+                # Scaling standard: value * (10 ^ scale)
+                # Come richiesto, usiamo rigorosamente lo scale factor riportato dal dispositivo
+                elif type(scale) is int and -pow10_offset <= scale <= pow10_offset:
+                    # Percorso veloce: nessuna operazione che possa sollevare eccezioni
+                    final_value = value * pow10[scale + pow10_offset]
+                else:
+                    # Scale factor fuori tabella o non intero: unico punto che può fallire
+                    try:
+                        final_value = float(value * (10 ** scale))
+                    except (TypeError, ValueError, OverflowError):
+                        # Scale factor non numerico o fuori range: valore scartato
+                        continue
 
-        return points
+            line = build_line(device_tags, endpoint_tags, field_name, float(final_value), now)
+            if line:
+                yield line
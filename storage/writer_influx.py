@@ -10,6 +10,7 @@ import json
 from pathlib import Path
 from app_logging import get_logger
 from config.config_manager import get_config_manager
+from parser.line_protocol import LINE_PROTOCOL_PRECISION, measurement_of, timestamp_to_ns
 
 try:
     from influxdb_client import InfluxDBClient, Point, WriteOptions
@@ -127,15 +128,22 @@ class InfluxWriter:
         except Exception as e:
             raise RuntimeError(f"Errore creazione bucket: {e}")
 
-    def _write_dry_run(self, points: List[Point]):
-        """Modalità dry-run per debug"""
+    def _write_dry_run(self, points: List[Point], line_precision: str = LINE_PROTOCOL_PRECISION):
+        """Modalità dry-run per debug
+
+        Tutte le righe del file hanno timestamp in nanosecondi, qualunque sia la precisione
+        di origine (es. righe e Point GME in secondi), così il file resta rileggibile.
+        """
         path = Path(self._influx_config.dry_file)
         path.parent.mkdir(parents=True, exist_ok=True)
         
         with path.open("a", encoding="utf-8") as f:
             for point in points:
-                if hasattr(point, 'to_line_protocol'):
-                    f.write(point.to_line_protocol() + "\n")
+                if isinstance(point, str):
+                    f.write(timestamp_to_ns(point, line_precision) + "\n")
+                elif hasattr(point, 'to_line_protocol'):
+                    precision = getattr(point, '_write_precision', LINE_PROTOCOL_PRECISION)
+                    f.write(timestamp_to_ns(point.to_line_protocol(), precision) + "\n")
                 else:
                     # Fallback per dict (compatibilità)
                     f.write(json.dumps(point) + "\n")
@@ -159,15 +167,17 @@ class InfluxWriter:
             # API e Web vanno nel bucket principale
             return self._influx_config.bucket
 
-    def write_points(self, points: List[Union[Point, Any]], measurement_type: str = None):
+    def write_points(self, points: List[Union[Point, str, Any]], measurement_type: str = None,
+                     line_precision: str = LINE_PROTOCOL_PRECISION):
         """Scrive Point objects su InfluxDB con bucket appropriato
         
         Args:
-            points: Lista di InfluxDB Point objects pronti per scrittura
+            points: Lista di InfluxDB Point objects (o righe line protocol) pronti per scrittura
             measurement_type: Tipo di measurement per determinare il bucket (opzionale)
+            line_precision: Precisione dei timestamp nelle righe line protocol (default: ns)
             
         Note:
-            - Accetta solo Point objects (elaborazione fatta nei parser)
+            - Accetta Point objects o righe line protocol già formattate dai parser
             - Supporta fallback per dict (compatibilità temporanea)
             - Usa bucket diversi per realtime (2 giorni) vs API/Web (retention default)
         """
@@ -178,8 +188,8 @@ class InfluxWriter:
         # Filtra solo Point objects validi + compatibilità dict
         valid_points = []
         for point in points:
-            if hasattr(point, 'to_line_protocol'):
-                # Point object InfluxDB
+            if hasattr(point, 'to_line_protocol') or (isinstance(point, str) and point):
+                # Point object InfluxDB o riga line protocol
                 valid_points.append(point)
             elif isinstance(point, dict) and all(k in point for k in ['measurement', 'fields']):
                 # Fallback per dict (compatibilità con parser che restituiscono dict)
@@ -190,7 +200,7 @@ class InfluxWriter:
             raise RuntimeError("Nessun Point object valido da scrivere")
         
         if self._influx_config.dry_mode:
-            self._write_dry_run(valid_points)
+            self._write_dry_run(valid_points, line_precision)
             return
         
         # Raggruppa punti per bucket
@@ -200,6 +210,8 @@ class InfluxWriter:
             # Determina measurement dal point
             if hasattr(point, '_name'):
                 measurement = point._name
+            elif isinstance(point, str):
+                measurement = measurement_of(point)
             elif isinstance(point, dict) and 'measurement' in point:
                 measurement = point['measurement']
             elif measurement_type:
@@ -222,17 +234,31 @@ class InfluxWriter:
         try:
             # Scrivi su ogni bucket con write precision configurabile
             for bucket, bucket_points in points_by_bucket.items():
-                self._write_api.write(
-                    bucket=bucket, 
-                    org=self._influx_config.org, 
-                    record=bucket_points,
-                    write_precision=self._influx_config.write_precision  # Precision configurabile
-                )
+                # Le righe line protocol non portano la precisione: vanno scritte a parte
+                lines = [p for p in bucket_points if isinstance(p, str)]
+                records = [p for p in bucket_points if not isinstance(p, str)] if lines else bucket_points
+
+                if records:
+                    self._write_api.write(
+                        bucket=bucket, 
+                        org=self._influx_config.org, 
+                        record=records,
+                        write_precision=self._influx_config.write_precision  # Precision configurabile
+                    )
+                if lines:
+                    self._write_api.write(
+                        bucket=bucket,
+                        org=self._influx_config.org,
+                        record=lines,
+                        write_precision=line_precision
+                    )
                 
                 # Extract measurement type for detailed logging
                 meas_type = "unknown"
                 if bucket_points and hasattr(bucket_points[0], '_name'):
                     meas_type = bucket_points[0]._name
+                elif bucket_points and isinstance(bucket_points[0], str):
+                    meas_type = measurement_of(bucket_points[0])
                 elif bucket_points and isinstance(bucket_points[0], dict):
                     meas_type = bucket_points[0].get('measurement', 'unknown')
                 elif measurement_type:
@@ -0,0 +1,93 @@
+"""
+Test timestamp GME: confronto con localize(is_dst=False) di pytz
+Copre un giorno ordinario, il passaggio all'ora legale e il ritorno all'ora solare (ora 25)
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+
+from parser.gme_parser import GMEParser
+
+ROME = 'Europe/Rome'
+
+# Giorno ordinario, passaggio all'ora legale (23 ore), ritorno all'ora solare (25 ore)
+DAYS = ['2024-06-15', '2024-03-31', '2024-10-27']
+
+
+def expected_epoch(date_str: str, hour: int, tz_name: str = ROME) -> int:
+    """Timestamp atteso come nel parser originale: inizio ora locale, ora 25 = mezzanotte successiva"""
+    day = datetime.strptime(date_str, '%Y-%m-%d')
+    local = day + timedelta(days=1) if hour == 25 else day + timedelta(hours=hour - 1)
+    aware = pytz.timezone(tz_name).localize(local, is_dst=False)
+    return int(aware.astimezone(pytz.utc).timestamp())
+
+
+def line_epochs(parser: GMEParser, date_str: str) -> dict:
+    """Timestamp per ora delle righe line protocol generate per tutte le ore 1..25"""
+    gme_data = {
+        'date': date_str,
+        'prices': [{'hour': hour, 'pun_mwh': 100.0 + hour} for hour in range(1, 26)],
+    }
+    epochs = {}
+    for line in parser.parse_line_protocol(gme_data):
+        tags = dict(part.split('=', 1) for part in line.split(' ', 1)[0].split(',')[1:])
+        epochs[int(tags['hour'])] = int(line.rsplit(' ', 1)[1])
+    return epochs
+
+
+@pytest.fixture(params=['zoneinfo', 'pytz'])
+def parser(request):
+    """Parser con timezone zoneinfo (default) o pytz (fallback)"""
+    gme_parser = GMEParser(ROME)
+    if request.param == 'pytz':
+        gme_parser.timezone = pytz.timezone(ROME)
+    return gme_parser
+
+
+@pytest.mark.parametrize('date_str', DAYS)
+def test_hour_timestamps_match_pytz_localize(parser, date_str):
+    epochs = line_epochs(parser, date_str)
+    assert sorted(epochs) == list(range(1, 26))
+    for hour, epoch in epochs.items():
+        assert epoch == expected_epoch(date_str, hour), f"{date_str} ora {hour}"
+
+
+def test_dst_days_have_switch_hour(parser):
+    # Passaggio all'ora legale: l'ora 3 (02:00 inesistente) è risolta in ora solare, come l'ora 4
+    spring = line_epochs(parser, '2024-03-31')
+    assert spring[3] - spring[2] == 3600
+    assert spring[4] - spring[3] == 0
+    # Ritorno all'ora solare: l'ora 3 (02:00 ambigua) è risolta in ora solare, due ore dopo l'ora 2
+    autumn = line_epochs(parser, '2024-10-27')
+    assert autumn[3] - autumn[2] == 7200
+    assert autumn[4] - autumn[3] == 3600
+    assert autumn[25] == expected_epoch('2024-10-28', 1)
+
+
+@pytest.mark.parametrize('gme_data', [None, {}, {'date': '2024-06-15'}])
+def test_empty_or_malformed_data_returns_no_lines(gme_data):
+    assert GMEParser(ROME).parse_line_protocol(gme_data) == []
+
+
+@pytest.mark.parametrize('tz_name', ['UTC', 'Etc/GMT-2'])
+def test_static_timezones_on_pytz_path(tz_name):
+    # pytz.utc e StaticTzInfo non accettano is_dst in utcoffset(): il fallback deve funzionare comunque
+    gme_parser = GMEParser(tz_name)
+    gme_parser.timezone = pytz.timezone(tz_name)
+    epochs = line_epochs(gme_parser, '2024-06-15')
+    assert sorted(epochs) == list(range(1, 26))
+    for hour, epoch in epochs.items():
+        assert epoch == expected_epoch('2024-06-15', hour, tz_name), f"{tz_name} ora {hour}"
+
+
+def test_points_match_line_protocol():
+    pytest.importorskip("influxdb_client")
+    gme_parser = GMEParser(ROME)
+    gme_data = {
+        'date': '2024-10-27',
+        'prices': [{'hour': hour, 'pun_mwh': 100.5 + hour} for hour in range(1, 26)],
+    }
+    points = [point.to_line_protocol() for point in gme_parser.parse(gme_data)]
+    assert points == gme_parser.parse_line_protocol(gme_data)
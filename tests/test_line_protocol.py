@@ -0,0 +1,88 @@
+"""
+Test parità tra parser/line_protocol.py e influxdb_client.Point.to_line_protocol()
+Escaping di tag e stringhe e formattazione dei float devono coincidere con il client
+"""
+
+import pytest
+
+from parser.line_protocol import (escape_tag, format_float, format_string, format_tags, measurement_of,
+                                  timestamp_to_ns)
+
+influxdb_client = pytest.importorskip("influxdb_client")
+Point = influxdb_client.Point
+WritePrecision = influxdb_client.WritePrecision
+
+TAG_VALUES = [
+    'Inverter',
+    'Power AC',
+    'a,b',
+    'k=v',
+    'tab\there',
+    'new\nline',
+    'cr\rhere',
+    'ends with\\',
+    '°C',
+]
+
+FLOAT_VALUES = [0.0, 1.0, -1.0, 0.1, 2.5, 123.456, 1e-7, 1e16, 1e20, 123456789.123, 285.0, 50.012]
+
+STRING_VALUES = ['SE5K-RW0TEBEN4', 'with "quotes"', 'back\\slash', 'spazi e virgole, ok']
+
+
+def point_line(tags: dict, field: str, value) -> str:
+    """Riga di riferimento generata da influxdb_client"""
+    point = Point("realtime")
+    for key, tag_value in tags.items():
+        point.tag(key, tag_value)
+    return point.field(field, value).time(1, WritePrecision.NS).to_line_protocol()
+
+
+@pytest.mark.parametrize('tag_value', TAG_VALUES)
+def test_tag_escaping_matches_point(tag_value):
+    tags = {'device_id': tag_value, 'endpoint': 'Power'}
+    assert f"realtime{format_tags(tags)} value=1 1" == point_line(tags, 'value', 1.0)
+
+
+def test_tags_sorted_and_empty_omitted():
+    tags = {'unit': '', 'endpoint': 'Power', 'device_id': 'inv'}
+    assert format_tags(tags) == ',device_id=inv,endpoint=Power'
+    assert f"realtime{format_tags(tags)} value=1 1" == point_line(tags, 'value', 1.0)
+
+
+@pytest.mark.parametrize('value', FLOAT_VALUES)
+def test_float_format_matches_point(value):
+    assert f"realtime,device_id=inv Inverter={format_float(value)} 1" == \
+        point_line({'device_id': 'inv'}, 'Inverter', value)
+
+
+@pytest.mark.parametrize('value', [float('nan'), float('inf'), float('-inf')])
+def test_non_finite_float_rejected(value):
+    with pytest.raises(ValueError):
+        format_float(value)
+
+
+@pytest.mark.parametrize('value', STRING_VALUES)
+def test_string_field_matches_point(value):
+    assert f"realtime,device_id=inv Inverter_Text={format_string(value)} 1" == \
+        point_line({'device_id': 'inv'}, 'Inverter_Text', value)
+
+
+def test_escape_tag_trailing_backslash():
+    assert escape_tag('x\\') == 'x\\ '
+
+
+def test_measurement_of():
+    assert measurement_of('realtime,device_id=inv value=1 1') == 'realtime'
+    assert measurement_of('gme_prices pun_mwh=1 1') == 'gme_prices'
+
+
+def test_timestamp_to_ns():
+    assert timestamp_to_ns('gme_prices,hour=1 pun_mwh=1 1718402400', 's') == \
+        'gme_prices,hour=1 pun_mwh=1 1718402400000000000'
+    assert timestamp_to_ns('realtime value=1 5', 'ns') == 'realtime value=1 5'
+    # Riga senza timestamp: invariata
+    assert timestamp_to_ns('realtime value=1', 's') == 'realtime value=1'
+    # Point GME con precisione secondi, come nel file dry-run
+    point = Point("gme_monthly_avg").field("pun_kwh_avg", 0.1).time(100, WritePrecision.S)
+    assert timestamp_to_ns(point.to_line_protocol(), point._write_precision) == \
+        'gme_monthly_avg pun_kwh_avg=0.1 100000000000'